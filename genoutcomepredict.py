@@ -49,69 +49,206 @@ There must be an Excel format input file in that directory named input_parameter
 
 import os
 import sys
+import shutil
+import tempfile
+import operator
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # graphs are only saved to file, so no display is needed (also in the worker processes)
 import matplotlib.pyplot as plt
-import statsmodels.stats.proportion as smp
-
-if len(sys.argv) != 2:
-    raise ValueError('The working directory with the required file: input_parameters.xlsx must be specified in the command line.')
-working_dir = sys.argv[1]
-if not os.path.exists(working_dir):
-    print("The working directory:", working_dir, "does not exist")
-    sys.exit()
-chk = os.path.join(working_dir, "input_parameters.xlsx")
-if not os.path.exists(chk):
-    print("The required file:", chk, "that contains all the specifications for the graphs, does not exist")
-    sys.exit()
-
-# Set random seed once for reproducibility
-np.random.seed(0)
-
-def bootstrap_mean_confidence_interval(data, num_boots=1000, ci=95):
-    samples = np.random.choice(data, size=(num_boots, len(data)), replace=True)
-    boot_means = np.mean(samples, axis=1)
+from matplotlib.patches import Rectangle
+try:
+    from numba import njit
+except ImportError:  # numba is optional - the threshold sweep falls back to plain numpy
+    njit = None
+try:
+    import bottleneck as bn
+except ImportError:  # bottleneck is optional - numpy is used instead
+    bn = None
+from statistics import NormalDist
+
+# Seed for the bootstraps. Each graph seeds its own generator with (SEED, its row number in input_parameters.xlsx),
+# so the bootstrap intervals do not depend on which worker process draws the graph or what it drew before
+SEED = 0
+
+# One figure is reused for every graph drawn by this process, rather than creating and closing a new one each time.
+# The lines and the CI band are also created only once; each graph just replaces their data
+FIG, AX = plt.subplots(figsize=(10, 6))
+LINE_ABOVE, = AX.plot([], [], marker='>', ms=10, fillstyle='none', linestyle='-', color='blue', label='Includes only above threshold')
+LINE_BELOW, = AX.plot([], [], marker='<', ms=10, fillstyle='none', linestyle='-', color='red', label='Includes only below threshold')
+CI_BAND = AX.add_patch(Rectangle((0, 0), 0, 0, color='purple', alpha=0.2, label='95% CI'))
+AX.grid(True)
+
+# The confidence interval band is calculated once from all of the data, so by default it uses the
+# closed-form intervals. Set to True to use the (much slower) bootstrap intervals instead
+BOOTSTRAP_CI = False
+
+def mean_confidence_interval(data, ci=95):
+    # Normal-theory interval: mean +/- z * standard error
+    mean = np.mean(data)
+    if len(data) < 2:
+        return mean, mean  # no spread can be estimated from a single value
+    z = NormalDist().inv_cdf(1 - (100 - ci) / 200)
+    se = np.std(data, ddof=1) / np.sqrt(len(data))
+    return mean - z * se, mean + z * se
+
+def proportion_confidence_interval(count, nobs, ci=95):
+    # Wilson score interval for a proportion
+    z = NormalDist().inv_cdf(1 - (100 - ci) / 200)
+    p = count / nobs
+    denom = 1 + z * z / nobs
+    center = (p + z * z / (2 * nobs)) / denom
+    half = z * np.sqrt(p * (1 - p) / nobs + z * z / (4 * nobs * nobs)) / denom
+    return center - half, center + half
+
+def median_confidence_interval(data, ci=95):
+    # Distribution-free interval for the median from the order statistics (Conover)
+    from scipy.stats import binom  # imported here as scipy.stats is slow to import and only needed for this
+    n = len(data)
+    r = int(binom.ppf((100 - ci) / 200, n, 0.5))
+    lower_i, upper_i = max(r - 1, 0), min(n - r, n - 1)
+    part = np.partition(data, [lower_i, upper_i])
+    return part[lower_i], part[upper_i]
+
+# Approximate number of resampled values held in memory at once during the bootstrap
+BOOT_BLOCK_SIZE = 2 ** 18
+
+def bootstrap_mean_confidence_interval(data, num_boots=1000, ci=95, seed=SEED):
+    # Resample a block of bootstrap replicates at a time so that the full num_boots x N
+    # sample matrix never has to be held in memory
+    rng = np.random.default_rng(seed)
+    n = len(data)
+    block = max(1, BOOT_BLOCK_SIZE // n)
+    boot_means = np.empty(num_boots)
+    samples = np.empty((min(block, num_boots), n), dtype=data.dtype)  # reused for every block
+    for start in range(0, num_boots, block):
+        stop = min(start + block, num_boots)
+        block_samples = samples[:stop - start]
+        np.take(data, rng.integers(0, n, size=block_samples.shape), out=block_samples)
+        boot_means[start:stop] = block_samples.mean(axis=1)
     lower_bound = np.percentile(boot_means, (100 - ci) / 2)
     upper_bound = np.percentile(boot_means, 100 - (100 - ci) / 2)
     return lower_bound, upper_bound
 
-def bootstrap_median_confidence_interval(data, num_boots=1000, ci=95):
-    samples = np.random.choice(data, size=(num_boots, len(data)), replace=True)
-    boot_medians = np.median(samples, axis=1)
+def bootstrap_median_confidence_interval(data, num_boots=1000, ci=95, seed=SEED):
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(data, size=(num_boots, len(data)), replace=True)
+    # One partition per replicate finds the middle value without the extra work np.median does.
+    # For an even number of values the lower middle value is the largest value below it
+    k = len(data) // 2
+    samples.partition(k, axis=1)
+    boot_medians = samples[:, k]
+    if len(data) % 2 == 0:
+        boot_medians = (samples[:, :k].max(axis=1) + boot_medians) / 2
     lower_bound = np.percentile(boot_medians, (100 - ci) / 2)
     upper_bound = np.percentile(boot_medians, 100 - (100 - ci) / 2)
     return lower_bound, upper_bound
 
-def apply_filters(df, filters, excel_file):
+# Filter operators that can be used in input_parameters.xlsx
+FILTER_OPS = {'==': operator.eq, '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '!=': operator.ne}
+
+def apply_filters(arrays, filters, excel_file):
+    # Combine all of the filters into one mask over the column arrays of a data file, so the data is only indexed once
+    mask = np.ones(len(next(iter(arrays.values()))), dtype=bool)
     for filter_var, filter_op, filter_criteria in filters:
         if pd.notna(filter_var):
-            if filter_var not in df.columns:
+            if filter_var not in arrays:
                 print("\nThe filter variable:", filter_var, "is not in", excel_file)
                 continue
-            query_str = f"`{filter_var}` {filter_op} {filter_criteria}"
-            df = df.query(query_str)
-    return df
+            filter_op = str(filter_op).strip()  # the sheet may pad the operator with spaces
+            if filter_op not in FILTER_OPS:
+                raise ValueError(f"Invalid filter operator '{filter_op}' for filter variable '{filter_var}'")
+            mask &= FILTER_OPS[filter_op](arrays[filter_var], float(filter_criteria))
+    return mask
+
+if njit is not None:
+    @njit(cache=True)
+    def _sweep(v, y, thresholds, minn, kind):
+        # Compiled version of the threshold sweep in calculate_statistics, used for means (kind 0)
+        # and medians (kind 1) when numba is available. v and y must already be sorted by v
+        y = y.astype(np.float64)
+        n = y.shape[0]
+        cum_y = np.zeros(n + 1)
+        cum_y[1:] = np.cumsum(y)
+        stats_above = np.full(thresholds.shape[0], np.nan)
+        stats_below = np.full(thresholds.shape[0], np.nan)
+        for i in range(thresholds.shape[0]):
+            lo = np.searchsorted(v, thresholds[i], side='left')    # v[lo:] >= threshold
+            hi = np.searchsorted(v, thresholds[i], side='right')   # v[:hi] <= threshold
+            if n - lo >= minn and n - lo > 0:
+                stats_above[i] = (cum_y[n] - cum_y[lo]) / (n - lo) if kind == 0 else np.median(y[lo:])
+            if hi >= minn and hi > 0:
+                stats_below[i] = cum_y[hi] / hi if kind == 0 else np.median(y[:hi])
+        return stats_above, stats_below
+else:
+    _sweep = None
+
+def calculate_thresholds(v, minn, num=20):
+    # v is the sorted predictor. The thresholds are spaced by quantile, from the minn-th smallest to the
+    # minn-th largest value, so that every threshold has at least minn data points on both sides
+    lo_i, hi_i = minn, len(v) - minn - 1
+    if hi_i < lo_i:
+        return np.linspace(v[0], v[-1], num)  # too few data points - no threshold can satisfy minn
+    return np.unique(v[np.linspace(lo_i, hi_i, num).astype(int)])
+
+def calculate_statistics(v, y, thresholds, minn, stat_func):
+    # v and y are the predictor and outcome arrays, sorted by the predictor,
+    # so that each threshold is just a split point in the sorted data.
+    # (Medians from bottleneck are faster than the compiled sweep, so it is only used for np.median)
+    if _sweep is not None and stat_func in (np.mean, np.median):
+        return _sweep(v, y, np.asarray(thresholds, dtype=np.float64), minn, 0 if stat_func is np.mean else 1)
+
+    n = len(y)
+    lo = np.searchsorted(v, thresholds, side='left')    # v[lo:] >= threshold
+    hi = np.searchsorted(v, thresholds, side='right')   # v[:hi] <= threshold
+    n_above = n - lo
+    n_below = hi
+
+    if stat_func is np.mean:
+        # Running sums give the mean above and below every threshold without re-filtering the data
+        cum_y = np.concatenate(([0.0], np.cumsum(y, dtype=np.float64)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats_above = (cum_y[-1] - cum_y[lo]) / n_above
+            stats_below = cum_y[hi] / n_below
+    else:
+        stats_above = np.array([stat_func(y[k:]) if n - k > 0 else np.nan for k in lo])
+        stats_below = np.array([stat_func(y[:k]) if k > 0 else np.nan for k in hi])
+
+    # Only plot a point when there are at least minn data points
+    stats_above = np.where(n_above >= minn, stats_above, np.nan)
+    stats_below = np.where(n_below >= minn, stats_below, np.nan)
+    return stats_above, stats_below
+
+def plot_TL_graph(v, y, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype, seed=SEED):
+    # v and y are the predictor and outcome values. They are sorted once by the predictor
+    # (numpy's sort is much faster than numba's, so this is not left to the compiled sweep)
+    order = np.argsort(v)
+    v = v[order]
+    y = y[order]
 
-def plot_TL_graph(df, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype):
     # Set up statistic and confidence interval functions based on graph type
     if graphtype == 'c':
         stat_func = np.mean
-        ci_func = bootstrap_mean_confidence_interval
+        ci_func = partial(bootstrap_mean_confidence_interval, seed=seed) if BOOTSTRAP_CI else mean_confidence_interval
         y_label = 'Average ' + oname
-        ci_lower, ci_upper = ci_func(df[outcome].values)
+        ci_lower, ci_upper = ci_func(y)
         y_lim = (oll, oul)
     elif graphtype == 'm':
-        stat_func = np.median
-        ci_func = bootstrap_median_confidence_interval
+        stat_func = bn.nanmedian if bn is not None else np.median  # bottleneck's median is much faster on small arrays
+        ci_func = partial(bootstrap_median_confidence_interval, seed=seed) if BOOTSTRAP_CI else median_confidence_interval
         y_label = 'Median ' + oname
-        ci_lower, ci_upper = ci_func(df[outcome].values)
+        ci_lower, ci_upper = ci_func(y)
         y_lim = (oll, oul)
     elif graphtype == 'p':
         # For proportions, outcome should be binary (0/1)
         stat_func = np.mean  # Mean of binary data gives proportion
-        cnt = df[outcome].sum()
-        nobs = df[outcome].size
-        ci_lower, ci_upper = smp.proportion_confint(cnt, nobs, alpha=0.05, method='wilson')
+        cnt = y.sum()
+        nobs = y.size
+        ci_lower, ci_upper = proportion_confidence_interval(cnt, nobs)
         y_label = 'Proportion of patients ' + oname
         y_lim = (0, 1)
     else:
@@ -119,112 +256,246 @@ def plot_TL_graph(df, output_dir, outcome, oname, oll, oul, variable, vname, plo
         return
 
     # Compute thresholds
-    thresholds = np.linspace(df[variable].min(), df[variable].max(), 20)
-    stats_above = []
-    stats_below = []
-
-    for threshold in thresholds:
-        filtered_above = df[df[variable] >= threshold]
-        filtered_below = df[df[variable] <= threshold]
-        stat_above = stat_func(filtered_above[outcome]) if filtered_above[outcome].size >= minn else np.nan
-        stat_below = stat_func(filtered_below[outcome]) if filtered_below[outcome].size >= minn else np.nan
-        stats_above.append(stat_above)
-        stats_below.append(stat_below)
+    thresholds = calculate_thresholds(v, minn)
+    stats_above, stats_below = calculate_statistics(v, y, thresholds, minn, stat_func)
 
     # Generate the plot
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = FIG, AX
     plot_title = f'{oname} by {vname} Threshold'
     ax.set_title(plot_title)
     ax.set_ylabel(y_label)
     ax.set_xlabel(f'Threshold level of {vname}')
-    ax.set_ylim(y_lim)
 
-    if plot_type == 1 or plot_type == 3:
-        ax.plot(thresholds, stats_above, marker='>', ms=10, fillstyle='none', linestyle='-', color='blue', label='Includes only above threshold')
-    if plot_type == 2 or plot_type == 3:
-        ax.plot(thresholds, stats_below, marker='<', ms=10, fillstyle='none', linestyle='-', color='red', label='Includes only below threshold')
+    LINE_ABOVE.set_data(thresholds, stats_above)
+    LINE_ABOVE.set_visible(plot_type == 1 or plot_type == 3)
+    LINE_BELOW.set_data(thresholds, stats_below)
+    LINE_BELOW.set_visible(plot_type == 2 or plot_type == 3)
 
-    if graphtype in ['c', 'm']:
-        ax.fill_between(thresholds, ci_lower, ci_upper, color='purple', alpha=0.2, label='95% CI')
-    elif graphtype == 'p':
-        # For proportions, ci_lower and ci_upper are scalars
-        ci_lower_arr = np.full_like(thresholds, ci_lower)
-        ci_upper_arr = np.full_like(thresholds, ci_upper)
-        ax.fill_between(thresholds, ci_lower_arr, ci_upper_arr, color='purple', alpha=0.2, label='95% CI')
+    # ci_lower and ci_upper are scalars, so the CI is a flat band across all of the thresholds
+    CI_BAND.set_bounds(thresholds[0], ci_lower, thresholds[-1] - thresholds[0], ci_upper - ci_lower)
+
+    # Rescale the x-axis to the new data
+    ax.relim(visible_only=True)
+    ax.autoscale_view(scaley=False)
+    ax.set_ylim(y_lim)
 
-    ax.legend()
-    plt.grid(True)
+    ax.legend(handles=[artist for artist in (LINE_ABOVE, LINE_BELOW, CI_BAND) if artist.get_visible()])
     figname = f"{variable}_{graphtype}_{outcome}_plot{plot_type}.png"
     figpath = os.path.join(output_dir, figname)
     print("Writing to:", figpath)
-    plt.savefig(figpath)
-    # plt.show()  # optional
-    plt.close(fig)  # Close the figure to free memory
+    fig.savefig(figpath)
+
+def read_parquet(parquet_path, columns, filters):
+    # Only the needed columns, and only the rows that pass filters, are read from a Parquet file.
+    # The criteria are numbers, so only filters on numeric columns are applied here (apply_filters does the rest)
+    import pyarrow.parquet as pq
+    import pyarrow.types
+    schema = pq.read_schema(parquet_path)
+    names = schema.names
+    filters = [f for f in filters if f[0] in names and
+               (pyarrow.types.is_integer(schema.field(f[0]).type) or pyarrow.types.is_floating(schema.field(f[0]).type))]
+    return pd.read_parquet(parquet_path, columns=[c for c in names if c in columns], filters=filters or None)
+
+def read_data(excel_file, columns, filters=()):
+    # The data can also be supplied as a Parquet file, either directly or next to the workbook with the same
+    # name (genoutcomepredict2.xlsx_to_parquet converts a workbook). An up to date Parquet file is preferred,
+    # as filters (the filters shared by every graph that uses this file) can be applied while reading it
+    parquet_path = os.path.splitext(excel_file)[0] + '.parquet'
+    if os.path.exists(parquet_path) and (parquet_path == excel_file or os.path.getmtime(parquet_path) >= os.path.getmtime(excel_file)):
+        return read_parquet(parquet_path, columns, filters)
 
-def main():
-    os.chdir(working_dir)
+    # Parsing xlsx files is slow, so the first read also saves the sheet next to the workbook in
+    # Feather format (excel_file + '.feather'). Later runs load that copy while it is newer than the workbook
+    cache_path = excel_file + '.feather'
+    try:
+        import pyarrow
+    except ImportError:  # the cache needs pyarrow
+        pyarrow = None
+    if pyarrow is not None:
+        try:
+            if os.path.getmtime(cache_path) >= os.path.getmtime(excel_file):
+                names = pyarrow.ipc.open_file(cache_path).schema.names
+                return pd.read_feather(cache_path, columns=[c for c in names if c in columns])
+        except (OSError, pyarrow.ArrowException):
+            pass
+    if pyarrow is None or not os.access(os.path.dirname(excel_file), os.W_OK):
+        # No cache can be written, so only the needed columns are parsed
+        return pd.read_excel(excel_file, engine='openpyxl', usecols=lambda c: c in columns)
+    df = pd.read_excel(excel_file, engine='openpyxl')
+    # Write to a temporary file of this process's own first so that another process never sees a partly written cache
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(cache_path) + '.', dir=os.path.dirname(cache_path))
+        os.close(fd)
+        df.to_feather(tmp_path)
+        shutil.copymode(excel_file, tmp_path)  # mkstemp makes the file private to its owner
+        os.replace(tmp_path, cache_path)
+    except (ValueError, TypeError, OSError, pyarrow.ArrowException):
+        # The cache is optional (it needs string column names and a single type in each column)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df[[c for c in df.columns if c in columns]]
+
+def needed_columns(row):
+    # The data columns used by one row of input_parameters.xlsx
+    columns = {row['outcome'], row['variable']}
+    for filter_var in (row['filter1'], row['filter2'], row['filter3'], row['filter4']):
+        if pd.notna(filter_var):
+            columns.add(filter_var)
+    return columns
+
+# Filter operators that can be pushed down into the Parquet reader. != is left out because it keeps missing values
+# in pandas but drops them in pyarrow
+PUSHDOWN_OPS = ('==', '>', '>=', '<', '<=')
+
+def pushdown_filters(row):
+    # The filters of one row of input_parameters.xlsx that can be applied while reading a Parquet file
+    filters = set()
+    for i in range(1, 5):
+        filter_var, filter_op, filter_criteria = row[f'filter{i}'], str(row[f'f{i}op']).strip(), row[f'f{i}criteria']
+        if pd.notna(filter_var) and filter_op in PUSHDOWN_OPS:
+            try:
+                filters.add((filter_var, filter_op, float(filter_criteria)))
+            except (TypeError, ValueError):
+                pass  # apply_filters will report this
+    return filters
+
+def column_arrays(df):
+    # The columns of a data file as numpy arrays, so each row's filters and statistics work on arrays
+    # without going through pandas
+    return {column: df[column].to_numpy() for column in df.columns}
+
+# Columns of the data files already loaded by this process, as {excel_file: {column: array}}
+data_cache = {}
+
+def process_row(row, columns, shared_filters, row_index):
+    # Generate the TL graph for one row of input_parameters.xlsx (row_index is its position in the sheet).
+    # columns are all of the columns used from the row's data file, shared_filters are the filters shared by every row using it
+    excel_file = row['excel_file']
+    if not os.path.exists(excel_file):
+        print("The Excel file:", excel_file, "specified in the first column of input_parameters.xlsx does not exist")
+        return
+    output_dir = row['output_dir']
+    os.makedirs(output_dir, exist_ok=True)  # another worker may be creating it at the same time
+    graphtype = row['graphtype']  # c for mean, m for median, p for proportion
+    outcome = row['outcome']
+    oname = row['oname']
+    oll = row['oLL']
+    oul = row['oUL']
+    variable = row['variable']
+    vname = row['vname']
+    filter1 = row['filter1']
+    f1op = row['f1op']
+    f1criteria = row['f1criteria']
+    filter2 = row['filter2']
+    f2op = row['f2op']
+    f2criteria = row['f2criteria']
+    filter3 = row['filter3']
+    f3op = row['f3op']
+    f3criteria = row['f3criteria']
+    filter4 = row['filter4']
+    f4op = row['f4op']
+    f4criteria = row['f4criteria']
+    plot_type = int(row['plot_type'])
+    minn = int(row['min_n'])
+
+    filters = [
+        (filter1, f1op, f1criteria),
+        (filter2, f2op, f2criteria),
+        (filter3, f3op, f3criteria),
+        (filter4, f4op, f4criteria)
+    ]
+
+    # Read the data (each worker process keeps its own copy of the data files it has used)
+    if excel_file not in data_cache:
+        data_cache[excel_file] = column_arrays(read_data(excel_file, columns, shared_filters))
+    arrays = data_cache[excel_file]
+
+    # Check that outcome and variable are in columns
+    if outcome not in arrays:
+        print("\nThe outcome variable:", outcome, "is not in", excel_file)
+        return
+    if variable not in arrays:
+        print("\nThe predictor variable:", variable, "is not in", excel_file)
+        return
+
+    # Apply filters, and remove rows with missing data in variable or outcome
+    v = arrays[variable]
+    y = arrays[outcome]
+    mask = apply_filters(arrays, filters, excel_file) & pd.notna(v) & pd.notna(y)
+    v = v[mask]
+    y = y[mask]
+
+    # Ensure that the data is not empty after filtering
+    if len(v) == 0:
+        print("Dataframe is empty after applying filters.")
+        return
+
+    # Single precision is plenty for the statistics and halves the memory that has to be read.
+    # Binary outcomes for proportion graphs fit in a single byte
+    outcome_dtype = np.float32
+    if graphtype == 'p' and np.isin(y, [0, 1]).all():
+        outcome_dtype = np.uint8
+    # The predictor is only downcast when that keeps every value (large integers such as dates do not fit)
+    v32 = v.astype(np.float32)
+    if (v32 == v).all():
+        v = v32
+    y = y.astype(outcome_dtype)
+
+    plot_TL_graph(v, y, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype, seed=(SEED, row_index))
+
+def main(working_dir):
     # Read parameters from the input Excel file
-    params_df = pd.read_excel('input_parameters.xlsx', engine='openpyxl')
-    for index, row in params_df.iterrows():
+    params_df = pd.read_excel(os.path.join(working_dir, 'input_parameters.xlsx'), engine='openpyxl')
+    # One dict per row - looking up a dict key is much cheaper than indexing a pandas Series
+    rows = params_df.to_dict('records')
+    # Relative file and folder names in the parameters are relative to the working directory
+    for row in rows:
+        row['excel_file'] = os.path.join(working_dir, row['excel_file'])
+        row['output_dir'] = os.path.join(working_dir, row['output_dir'])
+
+    # Collect the columns used from each data file so that every file is read only once,
+    # and only the columns that are actually needed are loaded
+    data_columns = {}
+    for row in rows:
+        data_columns.setdefault(row['excel_file'], set()).update(needed_columns(row))
+
+    # Filters used by every row with the same data file can be applied when the file is read
+    data_filters = {}
+    for row in rows:
         excel_file = row['excel_file']
-        if not os.path.exists(excel_file):
-            print("The Excel file:", excel_file, "specified in the first column of input_parameters.xlsx does not exist")
-            continue
-        output_dir = row['output_dir']
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        graphtype = row['graphtype']  # c for mean, m for median, p for proportion
-        outcome = row['outcome']
-        oname = row['oname']
-        oll = row['oLL']
-        oul = row['oUL']
-        variable = row['variable']
-        vname = row['vname']
-        filter1 = row['filter1']
-        f1op = row['f1op']
-        f1criteria = row['f1criteria']
-        filter2 = row['filter2']
-        f2op = row['f2op']
-        f2criteria = row['f2criteria']
-        filter3 = row['filter3']
-        f3op = row['f3op']
-        f3criteria = row['f3criteria']
-        filter4 = row['filter4']
-        f4op = row['f4op']
-        f4criteria = row['f4criteria']
-        plot_type = int(row['plot_type'])
-        minn = int(row['min_n'])
-
-        filters = [
-            (filter1, f1op, f1criteria),
-            (filter2, f2op, f2criteria),
-            (filter3, f3op, f3criteria),
-            (filter4, f4op, f4criteria)
-        ]
-
-        # Read the data
-        df = pd.read_excel(excel_file, engine='openpyxl')
-
-        # Check that outcome and variable are in columns
-        if outcome not in df.columns:
-            print("\nThe outcome variable:", outcome, "is not in", excel_file)
-            continue
-        if variable not in df.columns:
-            print("\nThe predictor variable:", variable, "is not in", excel_file)
-            continue
-
-        # Apply filters
-        df = apply_filters(df, filters, excel_file)
-
-        # Remove rows with missing data in variable or outcome
-        df = df.dropna(subset=[variable, outcome])
-
-        # Ensure that df is not empty after filtering
-        if df.empty:
-            print("Dataframe is empty after applying filters.")
-            continue
-
-        plot_TL_graph(df, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype)
+        filters = pushdown_filters(row)
+        data_filters[excel_file] = data_filters[excel_file] & filters if excel_file in data_filters else filters
+
+    # Read each data file once here so that its Feather cache is written before the workers need it
+    # (workers started by fork also inherit the loaded data)
+    for excel_file, columns in data_columns.items():
+        if os.path.exists(excel_file):
+            data_cache[excel_file] = column_arrays(read_data(excel_file, columns, data_filters[excel_file]))
+
+    # Each row is an independent graph, so the rows are shared out over a pool of processes.
+    # Rows of the same graph type and output folder are kept together so each worker gets runs of similar graphs
+    row_indexes = sorted(range(len(rows)), key=lambda i: (str(rows[i]['graphtype']), str(rows[i]['output_dir'])))
+    rows = [rows[i] for i in row_indexes]
+    columns = [data_columns[row['excel_file']] for row in rows]
+    filters = [data_filters[row['excel_file']] for row in rows]
+    max_workers = max(1, (os.cpu_count() or 2) - 1)
+    chunksize = max(1, len(rows) // (4 * max_workers))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(process_row, rows, columns, filters, row_indexes, chunksize=chunksize))
 
 if __name__ == "__main__":
-    main()
+    multiprocessing.freeze_support()  # needed when run as an executable built with pyinstaller
+    # The command line is only checked here, after freeze_support, as worker processes of a frozen
+    # executable are started with different arguments
+    if len(sys.argv) != 2:
+        raise ValueError('The working directory with the required file: input_parameters.xlsx must be specified in the command line.')
+    working_dir = os.path.abspath(sys.argv[1])
+    if not os.path.exists(working_dir):
+        print("The working directory:", working_dir, "does not exist")
+        sys.exit()
+    chk = os.path.join(working_dir, "input_parameters.xlsx")
+    if not os.path.exists(chk):
+        print("The required file:", chk, "that contains all the specifications for the graphs, does not exist")
+        sys.exit()
+    main(working_dir)
@@ -1,157 +1,471 @@
 import os
+import operator
+import shutil
+import tempfile
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import statsmodels.stats.proportion as smp
+import matplotlib
+matplotlib.use('Agg')  # figures are only written to file, including from worker processes
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+try:
+    from numba import njit
+except ImportError:  # numba is optional - the threshold sweep falls back to plain numpy
+    njit = None
+try:
+    import bottleneck as bn
+except ImportError:  # bottleneck is optional - numpy is used instead
+    bn = None
+from statistics import NormalDist
+
+
+BOOT_BLOCK_SIZE = 2 ** 18  # approximate number of resampled values held in memory at once
+SEED = 0  # bootstraps seed a generator with (SEED, row number), so their results do not depend on the worker
+
+FILTER_OPS = {'==': operator.eq, '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '!=': operator.ne}
+PUSHDOWN_OPS = ('==', '>', '>=', '<', '<=')  # not !=, which keeps missing values in pandas but drops them in pyarrow
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _sweep(v, y, thresholds, minn, kind):
+        # Compiled threshold sweep for calculate_statistics; v and y must already be sorted by v.
+        # kind is 0 for means and 1 for medians
+        y = y.astype(np.float64)
+        n = y.shape[0]
+        cum_y = np.zeros(n + 1)
+        cum_y[1:] = np.cumsum(y)
+        stats_above = np.full(thresholds.shape[0], np.nan)
+        stats_below = np.full(thresholds.shape[0], np.nan)
+        for i in range(thresholds.shape[0]):
+            lo = np.searchsorted(v, thresholds[i], side='left')    # v[lo:] >= threshold
+            hi = np.searchsorted(v, thresholds[i], side='right')   # v[:hi] <= threshold
+            if n - lo >= minn and n - lo > 0:
+                stats_above[i] = (cum_y[n] - cum_y[lo]) / (n - lo) if kind == 0 else np.median(y[lo:])
+            if hi >= minn and hi > 0:
+                stats_below[i] = cum_y[hi] / hi if kind == 0 else np.median(y[:hi])
+        return stats_above, stats_below
+else:
+    _sweep = None
 
 
 class TLGraphGenerator:
-    def __init__(self, working_dir):
+    def __init__(self, working_dir, bootstrap_ci=False):
         if not os.path.exists(working_dir):
             raise ValueError(f"The working directory '{working_dir}' does not exist.")
-        self.working_dir = working_dir
-        os.chdir(self.working_dir)
+        self.working_dir = os.path.abspath(working_dir)
+        self.bootstrap_ci = bootstrap_ci
+        self._data_cache = {}
+        self._array_cache = {}  # numpy arrays of the cached data columns, with the same keys as _data_cache
+        self._fig = self._ax = None  # figure reused for every graph, created when first needed
+        self._artists = None  # (above line, below line, CI band), reused by updating their data
+
+    def _path(self, path):
+        # Relative paths are relative to the working directory (absolute paths are returned unchanged)
+        return os.path.join(self.working_dir, path)
 
     def load_parameters(self, param_file='input_parameters.xlsx'):
-        if not os.path.exists(param_file):
+        if not os.path.exists(self._path(param_file)):
             raise ValueError(f"Parameter file '{param_file}' not found in working directory '{self.working_dir}'.")
-        self.params_df = pd.read_excel(param_file, engine='openpyxl')
+        self.params_df = pd.read_excel(self._path(param_file), engine='openpyxl')
 
-    def load_data(self, excel_file):
+    def _cache_key(self, excel_file, columns, filters):
+        excel_file = self._path(excel_file)
         if not os.path.exists(excel_file):
             raise ValueError(f"Data file '{excel_file}' not found.")
-        return pd.read_excel(excel_file, engine='openpyxl')
+        return (excel_file, os.path.getmtime(excel_file),
+                None if columns is None else frozenset(columns), frozenset(filters))
+
+    def load_data(self, excel_file, columns=None, filters=()):
+        # Each data file is parsed once per generator (until it is modified); only the requested columns are kept.
+        # filters are only guaranteed to be applied when reading Parquet - apply_filters must still be used
+        key = self._cache_key(excel_file, columns, filters)
+        excel_file = key[0]
+        if key not in self._data_cache:
+            parquet_path = os.path.splitext(excel_file)[0] + '.parquet'
+            if os.path.exists(parquet_path) and (parquet_path == excel_file or
+                                                 os.path.getmtime(parquet_path) >= os.path.getmtime(excel_file)):
+                df = self.read_parquet(parquet_path, columns, filters)
+            else:
+                df = self.read_cached_excel(excel_file, columns)
+            self._data_cache[key] = df
+        return self._data_cache[key]
+
+    def load_arrays(self, excel_file, columns=None, filters=()):
+        # The columns of load_data as {column: numpy array}, converted once per data file instead of for every graph
+        key = self._cache_key(excel_file, columns, filters)
+        if key not in self._array_cache:
+            df = self.load_data(excel_file, columns, filters)
+            self._array_cache[key] = {column: df[column].to_numpy() for column in df.columns}
+        return self._array_cache[key]
+
+    @staticmethod
+    def read_parquet(parquet_path, columns=None, filters=()):
+        # Projection and predicate pushdown: only the needed columns and the rows passing filters are read.
+        # Filters are only pushed down for numeric columns, as the criteria are numbers
+        import pyarrow.parquet as pq
+        import pyarrow.types
+        schema = pq.read_schema(parquet_path)
+        names = schema.names
+        if columns is not None:
+            columns = [c for c in names if c in columns]
+        filters = [f for f in filters if f[0] in names and
+                   (pyarrow.types.is_integer(schema.field(f[0]).type) or pyarrow.types.is_floating(schema.field(f[0]).type))]
+        return pd.read_parquet(parquet_path, columns=columns, filters=filters or None)
+
+    @staticmethod
+    def read_cached_excel(excel_file, columns=None):
+        # Keep a Feather copy of the sheet next to the workbook; it is much faster to load than xlsx
+        # and is used for as long as it is newer than the workbook. Only columns are returned (all if None)
+        cache_path = excel_file + '.feather'
+        try:
+            import pyarrow
+        except ImportError:  # the cache needs pyarrow
+            pyarrow = None
+        if pyarrow is not None:
+            try:
+                if os.path.getmtime(cache_path) >= os.path.getmtime(excel_file):
+                    if columns is not None:
+                        columns = [c for c in pyarrow.ipc.open_file(cache_path).schema.names if c in columns]
+                    return pd.read_feather(cache_path, columns=columns)
+            except (OSError, pyarrow.ArrowException):
+                pass
+        usecols = None if columns is None else (lambda c: c in columns)
+        if pyarrow is None or not os.access(os.path.dirname(excel_file), os.W_OK):
+            # No cache can be written, so only the needed columns are parsed
+            return pd.read_excel(excel_file, engine='openpyxl', usecols=usecols)
+        df = pd.read_excel(excel_file, engine='openpyxl')
+        # Write to a temporary file unique to this process, then rename, so another process never reads a partly written cache
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(cache_path) + '.',
+                                            dir=os.path.dirname(cache_path))
+            os.close(fd)
+            df.to_feather(tmp_path)
+            shutil.copymode(excel_file, tmp_path)  # mkstemp makes the file private to its owner
+            os.replace(tmp_path, cache_path)
+        except (ValueError, TypeError, OSError, pyarrow.ArrowException):
+            # the cache is optional (it needs string column names and a single type in each column)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+    @staticmethod
+    def needed_columns(row):
+        columns = {row['outcome'], row['variable']}
+        columns.update(f for f in (row['filter1'], row['filter2'], row['filter3'], row['filter4']) if pd.notna(f))
+        return columns
 
-    def apply_filters(self, df, filters):
+    @staticmethod
+    def pushdown_filters(row):
+        # The filters of a row that a Parquet reader can apply, as (variable, operator, criteria) tuples
+        filters = set()
+        for i in range(1, 5):
+            filter_var, filter_op, filter_criteria = row[f'filter{i}'], str(row[f'f{i}op']).strip(), row[f'f{i}criteria']
+            if pd.notna(filter_var) and filter_op in PUSHDOWN_OPS:
+                try:
+                    filters.add((filter_var, filter_op, float(filter_criteria)))
+                except (TypeError, ValueError):
+                    pass  # reported by apply_filters
+        return filters
+
+    def apply_filters(self, arrays, filters):
+        # Boolean mask of the rows passing every filter, built directly from the arrays of load_arrays
+        mask = np.ones(len(next(iter(arrays.values()))), dtype=bool)
         for filter_var, filter_op, filter_criteria in filters:
             if pd.notna(filter_var):
-                if filter_var not in df.columns:
+                if filter_var not in arrays:
                     print(f"Warning: Filter variable '{filter_var}' not in data columns, skipping filter.")
                     continue
-                query_str = f"`{filter_var}` {filter_op} {filter_criteria}"
-                df = df.query(query_str)
-        return df
+                filter_op = str(filter_op).strip()  # the sheet may pad the operator with spaces
+                if filter_op not in FILTER_OPS:
+                    raise ValueError(f"Invalid filter operator '{filter_op}' for filter variable '{filter_var}'.")
+                mask &= FILTER_OPS[filter_op](arrays[filter_var], float(filter_criteria))
+        return mask
 
-    def generate_graphs(self):
-        for _, row in self.params_df.iterrows():
-            try:
-                # Load data
-                df = self.load_data(row['excel_file'])
-
-                # Filter data
-                filters = [
-                    (row['filter1'], row['f1op'], row['f1criteria']),
-                    (row['filter2'], row['f2op'], row['f2criteria']),
-                    (row['filter3'], row['f3op'], row['f3criteria']),
-                    (row['filter4'], row['f4op'], row['f4criteria'])
-                ]
-                df = self.apply_filters(df, filters)
-
-                # Drop missing values for predictor and outcome
-                df = df.dropna(subset=[row['variable'], row['outcome']])
-                if df.empty:
-                    print(f"Warning: Dataframe is empty after filtering for '{row['excel_file']}', skipping graph.")
-                    continue
+    def generate_graphs(self, max_workers=None):
+        # Plain dicts are much cheaper to index than the Series that iterrows() produces
+        rows = self.params_df.to_dict('records')
+
+        # Union of the columns used from each data file, so every file is read once with just those columns
+        data_columns = {}
+        for row in rows:
+            data_columns.setdefault(row['excel_file'], set()).update(self.needed_columns(row))
 
-                # Plot TL graph
-                self.plot_TL_graph(
-                    df=df,
-                    output_dir=row['output_dir'],
-                    outcome=row['outcome'],
-                    oname=row['oname'],
-                    oll=row['oLL'],
-                    oul=row['oUL'],
-                    variable=row['variable'],
-                    vname=row['vname'],
-                    plot_type=int(row['plot_type']),
-                    minn=int(row['min_n']),
-                    graphtype=row['graphtype']
-                )
+        # Filters shared by every row that uses a data file can be pushed down into the Parquet reader
+        data_filters = {}
+        for row in rows:
+            filters = self.pushdown_filters(row)
+            data_filters[row['excel_file']] = data_filters.get(row['excel_file'], filters) & filters
+
+        # Load the data files up front; the workers start with a copy of their column arrays.
+        # A file that cannot be read is left to process_row, which reports it for each of its rows
+        for excel_file, columns in data_columns.items():
+            try:
+                if os.path.exists(self._path(excel_file)):
+                    self.load_arrays(excel_file, columns, data_filters[excel_file])
             except Exception as e:
-                print(f"Error processing row '{row}': {e}")
+                print(f"Error loading data file '{excel_file}': {e}")
+
+        # Each row is an independent graph, so rows are processed in parallel. Rows with the same
+        # graph type and output folder are sent to the workers in runs
+        row_indexes = sorted(range(len(rows)), key=lambda i: (str(rows[i]['graphtype']), str(rows[i]['output_dir'])))
+        rows = [rows[i] for i in row_indexes]
+        columns = [data_columns[row['excel_file']] for row in rows]
+        filters = [data_filters[row['excel_file']] for row in rows]
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 2) - 1)
+        chunksize = max(1, len(rows) // (4 * max_workers))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(self.working_dir, self.bootstrap_ci, self._array_cache)) as pool:
+            list(pool.map(_process_row, rows, columns, filters, row_indexes, chunksize=chunksize))
+
+    def process_row(self, row, columns, pushdown_filters=(), row_index=0):
+        # row_index is the row's position in the parameter sheet, which seeds its bootstrap
+        try:
+            # Load data
+            arrays = self.load_arrays(row['excel_file'], columns, pushdown_filters)
+
+            # Filter data
+            filters = [
+                (row['filter1'], row['f1op'], row['f1criteria']),
+                (row['filter2'], row['f2op'], row['f2criteria']),
+                (row['filter3'], row['f3op'], row['f3criteria']),
+                (row['filter4'], row['f4op'], row['f4criteria'])
+            ]
+            v = arrays[row['variable']]
+            y = arrays[row['outcome']]
 
-    def plot_TL_graph(self, df, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype):
+            # One mask for the filters and for missing predictor and outcome values
+            mask = self.apply_filters(arrays, filters) & pd.notna(v) & pd.notna(y)
+            v = v[mask]
+            y = y[mask]
+            if len(v) == 0:
+                print(f"Warning: Dataframe is empty after filtering for '{row['excel_file']}', skipping graph.")
+                return
+
+            # Downcast to halve the memory read by the statistics; binary outcomes fit in one byte
+            outcome_dtype = np.float32
+            if row['graphtype'] == 'p' and np.isin(y, [0, 1]).all():
+                outcome_dtype = np.uint8
+            # The predictor is only downcast when that keeps every value (large integers such as dates do not fit)
+            v32 = v.astype(np.float32)
+            if (v32 == v).all():
+                v = v32
+            y = y.astype(outcome_dtype)
+
+            # Plot TL graph
+            self.plot_TL_graph(
+                v=v,
+                y=y,
+                output_dir=row['output_dir'],
+                outcome=row['outcome'],
+                oname=row['oname'],
+                oll=row['oLL'],
+                oul=row['oUL'],
+                variable=row['variable'],
+                vname=row['vname'],
+                plot_type=int(row['plot_type']),
+                minn=int(row['min_n']),
+                graphtype=row['graphtype'],
+                seed=(SEED, row_index)
+            )
+        except Exception as e:
+            print(f"Error processing row '{row}': {e}")
+
+    def plot_TL_graph(self, v, y, output_dir, outcome, oname, oll, oul, variable, vname, plot_type, minn, graphtype,
+                      seed=SEED):
         # Set up output directory
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        output_dir = self._path(output_dir)
+        os.makedirs(output_dir, exist_ok=True)  # may be created by another worker at the same time
+
+        # Predictor and outcome values, sorted once by the predictor
+        order = np.argsort(v)
+        v = v[order]
+        y = y[order]
 
         # Set up statistic and confidence interval functions
-        stat_func, ci_func, y_label = self.get_statistic_functions(outcome, oname, graphtype)
-        ci_lower, ci_upper = ci_func(df[outcome].values)
+        stat_func, ci_func, y_label = self.get_statistic_functions(outcome, oname, graphtype, self.bootstrap_ci, seed)
+        ci_lower, ci_upper = ci_func(y)
         y_lim = (oll, oul) if graphtype in ['c', 'm'] else (0, 1)
 
         # Compute thresholds
-        thresholds = np.linspace(df[variable].min(), df[variable].max(), 20)
-        stats_above, stats_below = self.calculate_statistics(df, variable, outcome, thresholds, minn, stat_func)
+        thresholds = self.calculate_thresholds(v, minn)
+        stats_above, stats_below = self.calculate_statistics(v, y, thresholds, minn, stat_func)
 
         # Plotting
-        fig, ax = plt.subplots(figsize=(10, 6))
+        if self._fig is None:
+            # Created without pyplot, so it is not kept open by pyplot after the generator is gone
+            self._fig = Figure(figsize=(10, 6))
+            self._ax = self._fig.subplots()
+            line_above, = self._ax.plot([], [], marker='>', ms=10, fillstyle='none', linestyle='-', color='blue', label='Above threshold')
+            line_below, = self._ax.plot([], [], marker='<', ms=10, fillstyle='none', linestyle='-', color='red', label='Below threshold')
+            ci_band = self._ax.add_patch(Rectangle((0, 0), 0, 0, color='purple', alpha=0.2, label='95% CI'))
+            self._ax.grid(True)
+            self._artists = (line_above, line_below, ci_band)
+        fig, ax = self._fig, self._ax
+        line_above, line_below, ci_band = self._artists
         ax.set_title(f'{oname} by {vname} Threshold')
         ax.set_ylabel(y_label)
         ax.set_xlabel(f'Threshold level of {vname}')
-        ax.set_ylim(y_lim)
 
-        if plot_type in [1, 3]:
-            ax.plot(thresholds, stats_above, marker='>', ms=10, fillstyle='none', linestyle='-', color='blue', label='Above threshold')
-        if plot_type in [2, 3]:
-            ax.plot(thresholds, stats_below, marker='<', ms=10, fillstyle='none', linestyle='-', color='red', label='Below threshold')
+        line_above.set_data(thresholds, stats_above)
+        line_above.set_visible(plot_type in [1, 3])
+        line_below.set_data(thresholds, stats_below)
+        line_below.set_visible(plot_type in [2, 3])
+        ci_band.set_bounds(thresholds[0], ci_lower, thresholds[-1] - thresholds[0], ci_upper - ci_lower)
 
-        if graphtype in ['c', 'm']:
-            ax.fill_between(thresholds, ci_lower, ci_upper, color='purple', alpha=0.2, label='95% CI')
-        elif graphtype == 'p':
-            ci_lower_arr, ci_upper_arr = np.full_like(thresholds, ci_lower), np.full_like(thresholds, ci_upper)
-            ax.fill_between(thresholds, ci_lower_arr, ci_upper_arr, color='purple', alpha=0.2, label='95% CI')
+        ax.relim(visible_only=True)
+        ax.autoscale_view(scaley=False)
+        ax.set_ylim(y_lim)
 
-        ax.legend()
-        plt.grid(True)
+        ax.legend(handles=[artist for artist in self._artists if artist.get_visible()])
         figpath = os.path.join(output_dir, f"{variable}_{graphtype}_{outcome}_plot{plot_type}.png")
-        plt.savefig(figpath)
-        plt.close(fig)
+        fig.savefig(figpath)
 
     @staticmethod
-    def calculate_statistics(df, variable, outcome, thresholds, minn, stat_func):
-        stats_above, stats_below = [], []
-        for threshold in thresholds:
-            filtered_above = df[df[variable] >= threshold]
-            filtered_below = df[df[variable] <= threshold]
-            stat_above = stat_func(filtered_above[outcome]) if filtered_above[outcome].size >= minn else np.nan
-            stat_below = stat_func(filtered_below[outcome]) if filtered_below[outcome].size >= minn else np.nan
-            stats_above.append(stat_above)
-            stats_below.append(stat_below)
+    def calculate_thresholds(v, minn, num=20):
+        # Quantile-spaced thresholds over the sorted predictor v, leaving at least minn points on each side
+        lo_i, hi_i = minn, len(v) - minn - 1
+        if hi_i < lo_i:
+            return np.linspace(v[0], v[-1], num)  # no threshold can satisfy minn
+        return np.unique(v[np.linspace(lo_i, hi_i, num).astype(int)])
+
+    @staticmethod
+    def calculate_statistics(v, y, thresholds, minn, stat_func):
+        # v and y must be sorted by the predictor (v), so every threshold is a split point in the arrays
+        if _sweep is not None and stat_func in (np.mean, np.median):
+            return _sweep(v, y, np.asarray(thresholds, dtype=np.float64), minn, 0 if stat_func is np.mean else 1)
+
+        n = len(y)
+        lo = np.searchsorted(v, thresholds, side='left')    # v[lo:] >= threshold
+        hi = np.searchsorted(v, thresholds, side='right')   # v[:hi] <= threshold
+        n_above, n_below = n - lo, hi
+
+        if stat_func is np.mean:
+            # Running sums give every mean without re-filtering the data
+            cum_y = np.concatenate(([0.0], np.cumsum(y, dtype=np.float64)))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stats_above = (cum_y[-1] - cum_y[lo]) / n_above
+                stats_below = cum_y[hi] / n_below
+        else:
+            stats_above = np.array([stat_func(y[k:]) if n - k > 0 else np.nan for k in lo])
+            stats_below = np.array([stat_func(y[:k]) if k > 0 else np.nan for k in hi])
+
+        stats_above = np.where(n_above >= minn, stats_above, np.nan)
+        stats_below = np.where(n_below >= minn, stats_below, np.nan)
         return stats_above, stats_below
 
     @staticmethod
-    def get_statistic_functions(outcome, oname, graphtype):
+    def get_statistic_functions(outcome, oname, graphtype, bootstrap_ci=False, seed=SEED):
         if graphtype == 'c':
             stat_func = np.mean
-            ci_func = TLGraphGenerator.bootstrap_mean_confidence_interval
+            if bootstrap_ci:
+                ci_func = partial(TLGraphGenerator.bootstrap_mean_confidence_interval, seed=seed)
+            else:
+                ci_func = TLGraphGenerator.mean_confidence_interval
             y_label = 'Average ' + oname
         elif graphtype == 'm':
-            stat_func = np.median
-            ci_func = TLGraphGenerator.bootstrap_median_confidence_interval
+            stat_func = bn.nanmedian if bn is not None else np.median  # much lower call overhead on small arrays
+            if bootstrap_ci:
+                ci_func = partial(TLGraphGenerator.bootstrap_median_confidence_interval, seed=seed)
+            else:
+                ci_func = TLGraphGenerator.median_confidence_interval
             y_label = 'Median ' + oname
         elif graphtype == 'p':
             stat_func = np.mean  # Mean of binary data gives proportion
-            ci_func = lambda data: smp.proportion_confint(data.sum(), data.size, alpha=0.05, method='wilson')
+            ci_func = lambda data: TLGraphGenerator.proportion_confidence_interval(data.sum(), data.size)
             y_label = 'Proportion of ' + outcome
         else:
             raise ValueError(f"Invalid graphtype '{graphtype}' specified.")
         return stat_func, ci_func, y_label
 
     @staticmethod
-    def bootstrap_mean_confidence_interval(data, num_boots=1000, ci=95):
-        samples = np.random.choice(data, size=(num_boots, len(data)), replace=True)
-        boot_means = np.mean(samples, axis=1)
+    def mean_confidence_interval(data, ci=95):
+        mean = np.mean(data)
+        if len(data) < 2:
+            return mean, mean  # no spread can be estimated from a single value
+        z = NormalDist().inv_cdf(1 - (100 - ci) / 200)
+        se = np.std(data, ddof=1) / np.sqrt(len(data))
+        return mean - z * se, mean + z * se
+
+    @staticmethod
+    def proportion_confidence_interval(count, nobs, ci=95):
+        # Wilson score interval
+        z = NormalDist().inv_cdf(1 - (100 - ci) / 200)
+        p = count / nobs
+        denom = 1 + z * z / nobs
+        center = (p + z * z / (2 * nobs)) / denom
+        half = z * np.sqrt(p * (1 - p) / nobs + z * z / (4 * nobs * nobs)) / denom
+        return center - half, center + half
+
+    @staticmethod
+    def median_confidence_interval(data, ci=95):
+        # Order-statistic (Conover) interval for the median - no resampling needed
+        from scipy.stats import binom  # deferred: scipy.stats is slow to import
+        n = len(data)
+        r = int(binom.ppf((100 - ci) / 200, n, 0.5))
+        lower_i, upper_i = max(r - 1, 0), min(n - r, n - 1)
+        part = np.partition(data, [lower_i, upper_i])
+        return part[lower_i], part[upper_i]
+
+    @staticmethod
+    def bootstrap_mean_confidence_interval(data, num_boots=1000, ci=95, seed=SEED):
+        # Resample a block of replicates at a time instead of allocating a num_boots x N matrix
+        rng = np.random.default_rng(seed)
+        n = len(data)
+        block = max(1, BOOT_BLOCK_SIZE // n)
+        boot_means = np.empty(num_boots)
+        samples = np.empty((min(block, num_boots), n), dtype=data.dtype)  # reused for every block
+        for start in range(0, num_boots, block):
+            stop = min(start + block, num_boots)
+            block_samples = samples[:stop - start]
+            np.take(data, rng.integers(0, n, size=block_samples.shape), out=block_samples)
+            boot_means[start:stop] = block_samples.mean(axis=1)
         return np.percentile(boot_means, [(100 - ci) / 2, 100 - (100 - ci) / 2])
 
     @staticmethod
-    def bootstrap_median_confidence_interval(data, num_boots=1000, ci=95):
-        samples = np.random.choice(data, size=(num_boots, len(data)), replace=True)
-        boot_medians = np.median(samples, axis=1)
+    def bootstrap_median_confidence_interval(data, num_boots=1000, ci=95, seed=SEED):
+        rng = np.random.default_rng(seed)
+        samples = rng.choice(data, size=(num_boots, len(data)), replace=True)
+        # One partition per replicate finds the middle value without the extra work np.median does.
+        # For an even number of values the lower middle value is the largest value below it
+        k = len(data) // 2
+        samples.partition(k, axis=1)
+        boot_medians = samples[:, k]
+        if len(data) % 2 == 0:
+            boot_medians = (samples[:, :k].max(axis=1) + boot_medians) / 2
         return np.percentile(boot_medians, [(100 - ci) / 2, 100 - (100 - ci) / 2])
 
 
+def xlsx_to_parquet(excel_file):
+    # One-off conversion of a data workbook (first worksheet) to a Parquet file next to it. From then on the
+    # Parquet file is read instead of the workbook, for as long as it is newer
+    parquet_path = os.path.splitext(excel_file)[0] + '.parquet'
+    pd.read_excel(excel_file, engine='openpyxl').to_parquet(parquet_path, index=False)
+    return parquet_path
+
+
+_worker_generator = None  # the TLGraphGenerator used by a worker process
+
+
+def _init_worker(working_dir, bootstrap_ci, array_cache):
+    global _worker_generator
+    _worker_generator = TLGraphGenerator(working_dir, bootstrap_ci)
+    _worker_generator._array_cache = array_cache
+
+
+def _process_row(row, columns, pushdown_filters, row_index):
+    _worker_generator.process_row(row, columns, pushdown_filters, row_index)
+
+
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # needed for executables built with pyinstaller
     working_directory = input("Enter the working directory containing 'input_parameters.xlsx': ")
     try:
         generator = TLGraphGenerator(working_directory)